@@ -13,10 +13,14 @@ import os
 import sys
 import json
 import re
+import calendar
 import http.client
-import urllib.request
-import urllib.error
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
+from functools import lru_cache
+from itertools import islice
+
+from https_client import JSON_SEPARATORS, https_request, json_or_exit
 
 # ---------------------------------------------------------------------------
 # Config
@@ -28,6 +32,57 @@ GITHUB_REPO = os.environ.get("GITHUB_REPOSITORY", "")
 CLAUDE_MODEL = "claude-sonnet-4-20250514"
 MAX_TOKENS = 8192
 SITE_URL = "https://electionriskmap.org"
+SITE_FILES = {
+    "html": "index.html",
+    "feed": "feed.xml",
+    "monitor": "scripts/monitor.py",
+}
+
+# ---------------------------------------------------------------------------
+# Compiled patterns
+# ---------------------------------------------------------------------------
+_TL_ITEM_FULL_RE = re.compile(
+    r'<div class="tl-item">\s*<div class="tl-date">(.*?)</div>.*?</div>\s*</div>', re.DOTALL | re.ASCII
+)
+_TL_DATE_RE = re.compile(r'<div class="tl-date">(.*?)</div>')
+_TL_PARTS_RE = re.compile(
+    r'<div class="tl-date">(.*?)</div>\s*'
+    r'<div class="tl-dot" style="background:([^"]*)"></div>\s*'
+    r'<div class="tl-text">(.*?)</div>',
+    re.DOTALL | re.ASCII,
+)
+_DATE_SHAPE_RE = re.compile(
+    r'^(?:(?P<mon>[A-Za-z]+)\s+)?(?P<num>\d+)(?:,?\s+(?P<yr>\d{4}))?$', re.ASCII
+)
+_MONTHS = {
+    name.lower(): i
+    for names in (calendar.month_abbr, calendar.month_name)
+    for i, name in enumerate(names)
+    if name
+}
+# The class used in the site plus the old-style tag
+_NEW_TAGS = (
+    '<span class="tl-new">New</span>',
+    '<span class="timeline-tag new">New</span>',
+)
+
+# Stat counters and the two page dates, rewritten together in one pass
+_PAGE_FIELDS_RE = re.compile(
+    r'(?P<stat>data-stat="(?P<attr>sued|complied|contacted|court)"[^>]*>)\s*\d+'
+    r'|(?P<updated>(?i:Last updated)[:\s]*)\w+ \d{1,2}, \d{4}'
+    r'|(?P<as_of>Data as of )\w+ \d{4}',
+    re.ASCII,
+)
+_STAT_KEY_BY_ATTR = {
+    "sued": "states_sued",
+    "complied": "states_complied",
+    "contacted": "states_contacted",
+    "court": "court_wins_merits",
+}
+
+_FEED_ITEM_RE = re.compile(r'<item>.*?</item>', re.DOTALL)
+_FEED_ITEM_DESCRIPTION_RE = re.compile(r'<description>.*?</description>', re.DOTALL)
+_INTER_TAG_WS_RE = re.compile(r'>\s+<', re.ASCII)
 
 
 def load_github_event():
@@ -87,59 +142,86 @@ def parse_edits_comment(comment: str) -> dict:
     **Body:**
     ...email text...
     """
-    result = {
-        "corrections": "",
-        "email_subject": "",
-        "email_body": "",
+    subject = ""
+    corrections, email_lines, body_lines = [], [], []
+    section = None
+    saw_body = False
+
+    # One pass over the lines; `section` tracks where the current line belongs
+    for line in comment.splitlines():
+        stripped = line.strip()
+
+        # The body runs until a --- rule and may contain its own headings
+        if section == "body":
+            if stripped.startswith("---"):
+                section = None
+            else:
+                body_lines.append(line)
+            continue
+
+        if stripped.startswith("#"):
+            heading = stripped.lstrip("#").strip().lower()
+            if heading.startswith("corrections"):
+                section = "corrections"
+            elif "email" in heading:
+                section = "email"
+            else:
+                section = None
+            continue
+
+        # Subject may be written **Subject:** or Subject: or *Subject:*; it
+        # also ends the corrections when no email heading comes between them
+        if not subject:
+            value = _split_label(line, "subject")
+            if value is not None:
+                subject = value
+                if section == "corrections":
+                    section = "email"
+                continue
+
+        value = _split_label(line, "body")
+        if value is not None:
+            section = "body"
+            saw_body = True
+            if value:
+                body_lines.append(value)
+            continue
+
+        if section == "corrections":
+            corrections.append(line)
+        elif section == "email":
+            email_lines.append(line)
+
+    # Fallback: everything in the email section that isn't the subject
+    body = body_lines if saw_body else email_lines
+    return {
+        "corrections": "\n".join(corrections).strip(),
+        "email_subject": subject,
+        "email_body": "\n".join(body).strip(),
     }
 
-    # Extract corrections section
-    corrections_match = re.search(
-        r'##?\s*Corrections.*?\n(.*?)(?=##?\s|$)',
-        comment,
-        re.DOTALL | re.IGNORECASE,
-    )
-    if corrections_match:
-        result["corrections"] = corrections_match.group(1).strip()
-
-    # Extract email subject — handle **Subject:** or Subject: or *Subject:*
-    subject_match = re.search(
-        r'(?:\*\*)?Subject:?\*?\*?\s*(.+?)(?:\n|$)',
-        comment,
-        re.IGNORECASE,
-    )
-    if subject_match:
-        result["email_subject"] = subject_match.group(1).strip()
-
-    # Extract email body — everything after **Body:** or Body: until the end or next section
-    body_match = re.search(
-        r'(?:\*\*)?Body:?\*?\*?\s*\n(.*?)(?=\n---|\Z)',
-        comment,
-        re.DOTALL | re.IGNORECASE,
-    )
-    if body_match:
-        result["email_body"] = body_match.group(1).strip()
-    else:
-        # Fallback: everything after the Subject line that isn't the subject
-        email_section = re.search(
-            r'##?\s*(?:Send this )?[Ee]mail.*?\n(.*)',
-            comment,
-            re.DOTALL,
-        )
-        if email_section:
-            section = email_section.group(1)
-            # Remove the subject line, keep the rest as body
-            body_part = re.sub(r'\*\*Subject:\*\*.*?\n', '', section).strip()
-            # Remove **Body:** marker if present
-            body_part = re.sub(r'^\*\*Body:\*\*\s*', '', body_part).strip()
-            result["email_body"] = body_part
 
-    return result
+def _split_label(line: str, label: str):
+    """Return the text after a `label:` marker (bold or plain) at the start of line, or None."""
+    text = line.strip().lstrip("*")
+    if text[:len(label)].lower() != label:
+        return None
+    rest = text[len(label):].lstrip("*")
+    if not rest.startswith(":"):
+        return None
+    return rest[1:].lstrip("*").strip()
 
 
 # ---------------------------------------------------------------------------
 # Claude API helpers
 # ---------------------------------------------------------------------------
+_CLAUDE_HEADERS = {
+    "Content-Type": "application/json",
+    "x-api-key": ANTHROPIC_API_KEY,
+    "anthropic-version": "2023-06-01",
+}
+
+
 def call_claude(system_prompt: str, user_prompt: str) -> dict:
     """Call Claude API."""
     payload = {
@@ -148,24 +230,17 @@ def call_claude(system_prompt: str, user_prompt: str) -> dict:
         "system": system_prompt,
         "messages": [{"role": "user", "content": user_prompt}],
     }
-    data = json.dumps(payload).encode("utf-8")
-    req = urllib.request.Request(
-        "https://api.anthropic.com/v1/messages",
-        data=data,
-        headers={
-            "Content-Type": "application/json",
-            "x-api-key": ANTHROPIC_API_KEY,
-            "anthropic-version": "2023-06-01",
-        },
-        method="POST",
+    # json.dumps escapes non-ASCII by default, so the ASCII codec always applies
+    data = json.dumps(payload, separators=JSON_SEPARATORS).encode("ascii")
+    status, body = https_request(
+        "api.anthropic.com",
+        "POST",
+        "/v1/messages",
+        data,
+        _CLAUDE_HEADERS,
+        timeout=120,
     )
-    try:
-        with urllib.request.urlopen(req, timeout=120) as resp:
-            return json.loads(resp.read().decode("utf-8"))
-    except urllib.error.HTTPError as e:
-        body = e.read().decode("utf-8") if e.fp else ""
-        print(f"Claude API error {e.code}: {body}", file=sys.stderr)
-        sys.exit(1)
+    return json_or_exit("Claude", status, body, ok=(200,))
 
 
 def extract_text(response: dict) -> str:
@@ -174,26 +249,79 @@ def extract_text(response: dict) -> str:
     )
 
 
+_JSON_DECODER = json.JSONDecoder()
+
+
 def parse_json_response(text: str) -> dict:
-    cleaned = text.strip()
-    if cleaned.startswith("```"):
-        cleaned = cleaned.split("\n", 1)[1] if "\n" in cleaned else cleaned[3:]
-    if cleaned.endswith("```"):
-        cleaned = cleaned[:-3]
-    cleaned = cleaned.strip()
-    start = cleaned.find("{")
-    end = cleaned.rfind("}") + 1
-    if start == -1 or end == 0:
-        print(f"No JSON found in response: {cleaned[:300]}", file=sys.stderr)
+    # Decode the first complete object starting at the first "{" — skips any
+    # ``` fences or prose, and braces inside later text can't truncate it
+    start = text.find("{")
+    if start == -1:
+        print(f"No JSON found in response: {text.strip()[:300]}", file=sys.stderr)
         sys.exit(1)
     try:
-        return json.loads(cleaned[start:end])
+        return _JSON_DECODER.raw_decode(text, start)[0]
     except json.JSONDecodeError as e:
         print(f"JSON parse error: {e}", file=sys.stderr)
-        print(f"Raw: {cleaned[start:end][:500]}", file=sys.stderr)
+        print(f"Raw: {text[start:start + 500]}", file=sys.stderr)
         sys.exit(1)
 
 
+# Fields Claude returns as text; anything missing or null becomes ""
+UPDATE_TEXT_FIELDS = (
+    "new_timeline_entries_html",
+    "new_feed_items_xml",
+    "feed_last_build_date",
+    "monitor_timeline_additions",
+    "last_updated_date",
+    "email_subject",
+    "email_body",
+)
+
+
+def normalize_updates(raw) -> dict:
+    """Coerce Claude's JSON into the shape main() expects.
+
+    Text fields are always str (a list of strings is joined one per line;
+    any other type is an error, since it would be published as its repr),
+    and stat_updates is either None or a dict of every stat key mapped to
+    an int (or None when unchanged/unusable).
+    """
+    if not isinstance(raw, dict):
+        print(f"Expected a JSON object, got {type(raw).__name__}", file=sys.stderr)
+        sys.exit(1)
+    updates = {}
+    for field in UPDATE_TEXT_FIELDS:
+        value = raw.get(field)
+        if value is None:
+            value = ""
+        elif isinstance(value, list) and all(isinstance(item, str) for item in value):
+            value = "\n".join(value)
+        elif not isinstance(value, str):
+            print(f"Expected a string for {field}, got {type(value).__name__}", file=sys.stderr)
+            sys.exit(1)
+        updates[field] = value
+
+    stats = raw.get("stat_updates")
+    updates["stat_updates"] = {
+        key: _as_count(stats.get(key)) for key in _STAT_KEY_BY_ATTR.values()
+    } if isinstance(stats, dict) else None
+    return updates
+
+
+def _as_count(value):
+    """Return value as a non-negative int, or None if it isn't one."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, str) and value.strip().isdecimal():
+        return int(value)
+    if isinstance(value, int) and value >= 0:
+        return value
+    if isinstance(value, float) and value.is_integer() and value >= 0:
+        return int(value)
+    return None
+
+
 # ---------------------------------------------------------------------------
 # Claude prompts
 # ---------------------------------------------------------------------------
@@ -201,7 +329,7 @@ SYSTEM_PROMPT = """You are the update engine for electionriskmap.org, a nonparti
 tracking federal election interference risks ahead of the 2026 midterms.
 
 You will receive findings from an automated scan (already fact-checked and approved by a human),
-plus the current timeline HTML and feed.xml.
+plus a summary of the current timeline and recent feed.xml items.
 
 Your job is to generate structured JSON output with the exact updates to apply.
 Be precise. Match the existing HTML/XML style exactly. Do not invent facts.
@@ -224,7 +352,7 @@ CRITICAL RULES:
 """
 
 
-def build_clean_prompt(issue_body, timeline_html, feed_xml):
+def build_clean_prompt(issue_body, timeline, feed_items):
     """Prompt for 'approved' mode — generate everything from the issue."""
     return f"""Here are the approved findings from the automated scan:
 
@@ -232,12 +360,12 @@ def build_clean_prompt(issue_body, timeline_html, feed_xml):
 {issue_body}
 --- END ISSUE BODY ---
 
---- CURRENT TIMELINE HTML ---
-{timeline_html}
+--- CURRENT TIMELINE (newest entries, one JSON object per line) ---
+{timeline}
 --- END TIMELINE ---
 
---- CURRENT feed.xml ---
-{feed_xml}
+--- CURRENT feed.xml HEAD AND ITEMS (descriptions after the first item trimmed) ---
+{feed_items}
 --- END feed.xml ---
 
 Generate a JSON response with this exact structure:
@@ -260,9 +388,14 @@ Generate a JSON response with this exact structure:
 Set stat fields to null if unchanged. Respond ONLY with JSON."""
 
 
-def build_edits_prompt(issue_body, corrections, timeline_html, feed_xml):
-    """Prompt for 'approved with edits' mode — apply corrections to findings."""
-    return f"""Here are the findings from the automated scan, BUT they need corrections.
+def build_edits_prompt(issue_body, corrections, timeline, feed_items):
+    """Prompt for 'approved with edits' mode — apply corrections to findings.
+
+    With no corrections (the human only rewrote the email) the findings go
+    in as-is; the prompt still skips the email fields Claude would otherwise write.
+    """
+    if corrections:
+        findings = f"""Here are the findings from the automated scan, BUT they need corrections.
 Apply the corrections below before generating updates.
 
 --- ISSUE BODY (original findings — may contain errors) ---
@@ -271,28 +404,43 @@ Apply the corrections below before generating updates.
 
 --- CORRECTIONS TO APPLY ---
 {corrections}
---- END CORRECTIONS ---
+--- END CORRECTIONS ---"""
+        heading = "Generate the CORRECTED updates as JSON (same structure as always):"
+        entries = "HTML with corrections applied."
+        feed = "Corrected XML items for feed.xml."
+        lines = "Corrected plain text lines for monitor.py."
+    else:
+        findings = f"""Here are the approved findings from the automated scan.
 
---- CURRENT TIMELINE HTML ---
-{timeline_html}
+--- ISSUE BODY ---
+{issue_body}
+--- END ISSUE BODY ---"""
+        heading = "Generate the updates as JSON (same structure as always):"
+        entries = "HTML string of new <div class='tl-item'> entries."
+        feed = "XML string of new <item> elements for feed.xml."
+        lines = "Plain text lines to add to CURRENT_TIMELINE in monitor.py."
+    return f"""{findings}
+
+--- CURRENT TIMELINE (newest entries, one JSON object per line) ---
+{timeline}
 --- END TIMELINE ---
 
---- CURRENT feed.xml ---
-{feed_xml}
+--- CURRENT feed.xml HEAD AND ITEMS (descriptions after the first item trimmed) ---
+{feed_items}
 --- END feed.xml ---
 
-Generate the CORRECTED updates as JSON (same structure as always):
+{heading}
 {{
-  "new_timeline_entries_html": "HTML with corrections applied. MUST use tl-item/tl-date/tl-dot/tl-text classes. Include <span class='tl-new'>New</span>.",
+  "new_timeline_entries_html": "{entries} MUST use tl-item/tl-date/tl-dot/tl-text classes. Include <span class='tl-new'>New</span>.",
   "stat_updates": {{
     "states_sued": null,
     "states_complied": null,
     "states_contacted": null,
     "court_wins_merits": null
   }},
-  "new_feed_items_xml": "Corrected XML items for feed.xml.",
+  "new_feed_items_xml": "{feed}",
   "feed_last_build_date": "RFC 822 date string",
-  "monitor_timeline_additions": "Corrected plain text lines for monitor.py.",
+  "monitor_timeline_additions": "{lines}",
   "last_updated_date": "Month DD, YYYY"
 }}
 
@@ -303,157 +451,258 @@ Set stat fields to null if unchanged. Respond ONLY with JSON."""
 # ---------------------------------------------------------------------------
 # File manipulation helpers
 # ---------------------------------------------------------------------------
+def read_file(path: str) -> str:
+    """Read a whole UTF-8 file with one sized read (no text-layer newline handling)."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        return os.read(fd, os.fstat(fd).st_size).decode("utf-8")
+    finally:
+        os.close(fd)
+
+
+def write_file(path: str, content: str):
+    """Write via a temp file and rename, so a crash never leaves a half-written file."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+def read_site_files(*names: str) -> dict:
+    """Read the named site files (keys of SITE_FILES) concurrently."""
+    with ThreadPoolExecutor(max_workers=len(names)) as ex:
+        futures = {name: ex.submit(read_file, SITE_FILES[name]) for name in names}
+        return {name: fut.result() for name, fut in futures.items()}
+
+
+def write_site_files(contents: dict):
+    """Write the updated site files concurrently."""
+    with ThreadPoolExecutor(max_workers=len(contents)) as ex:
+        futures = [ex.submit(write_file, SITE_FILES[name], text) for name, text in contents.items()]
+        for fut in futures:
+            fut.result()
+
+
 def extract_timeline_section(html: str) -> str:
     """Extract timeline entries from index.html (first 10 for context)."""
-    entries = re.findall(r'<div class="tl-item">.*?</div>\s*</div>\s*</div>', html, re.DOTALL)
+    entries = [m.group(0) for m in islice(_TL_ITEM_FULL_RE.finditer(html), 10)]
     if entries:
-        return "\n".join(entries[:10])
-    # Fallback: broader match
-    match = re.search(r'(<div class="timeline[^"]*"[^>]*>)(.*?)(</div>\s*</section>)', html, re.DOTALL)
-    if match:
-        return match.group(0)[:3000]
+        return "\n".join(entries)
+    # Fallback: the whole timeline container
+    start = html.find('<div class="timeline')
+    if start != -1:
+        end = div_block_end(html, start)
+        if end != -1:
+            return html[start:end][:3000]
     return "(Could not extract timeline section)"
 
 
-def insert_timeline_entries(html: str, new_entries: str) -> str:
-    """Insert new entries in chronological position (newest first by event date)."""
-    import re
-    from datetime import datetime
-
-    def parse_tl_date(date_str):
-        """Parse a timeline date string into a sortable value."""
-        date_str = date_str.strip()
-        # Try "Feb 6" style (current year)
-        for fmt in ["%b %d", "%B %d"]:
-            try:
-                d = datetime.strptime(date_str, fmt).replace(year=2026)
-                return d
-            except ValueError:
-                pass
-        # Try "Jan 2026" style
-        for fmt in ["%b %Y", "%B %Y"]:
-            try:
-                return datetime.strptime(date_str, fmt)
-            except ValueError:
-                pass
-        # Try "Dec 2025" etc
-        for fmt in ["%b %Y", "%B %Y"]:
-            try:
-                return datetime.strptime(date_str, fmt)
-            except ValueError:
-                pass
-        # Fallback: just a year
+def div_block_end(html: str, start: int) -> int:
+    """Return the offset just past the </div> closing the <div> at start, or -1.
+
+    Linear str.find walk that counts nesting depth; no regex backtracking.
+    """
+    depth = 0
+    pos = start
+    next_open = html.find("<div", pos)
+    while True:
+        next_close = html.find("</div>", pos)
+        if next_close == -1:
+            return -1
+        if next_open != -1 and next_open < next_close:
+            depth += 1
+            pos = next_open + len("<div")
+            next_open = html.find("<div", pos)
+        else:
+            depth -= 1
+            pos = next_close + len("</div>")
+            if depth == 0:
+                return pos
+
+
+@lru_cache(maxsize=256)
+def parse_tl_date(date_str: str) -> datetime:
+    """Parse a timeline date ("Feb 6", "Jan 2026", "2025") into a sortable value."""
+    match = _DATE_SHAPE_RE.match(date_str.strip())
+    if match:
+        mon, num, yr = match.group("mon", "num", "yr")
+        month = _MONTHS.get(mon.lower()) if mon else None
         try:
-            return datetime(int(date_str), 1, 1)
-        except (ValueError, TypeError):
-            return datetime(2020, 1, 1)  # unknown dates go to bottom
+            if month and yr:
+                # "Feb 6, 2026" style
+                return datetime(int(yr), month, int(num))
+            if month and len(num) == 4:
+                # "Jan 2026" style
+                return datetime(int(num), month, 1)
+            if month:
+                # "Feb 6" style (current year)
+                return datetime(2026, month, int(num))
+            if not mon and not yr:
+                # Just a year
+                return datetime(int(num), 1, 1)
+        except ValueError:
+            pass
+    return datetime(2020, 1, 1)  # unknown dates go to bottom
+
+
+def compact_timeline_for_prompt(html: str, limit: int = 10) -> str:
+    """Summarize the newest timeline entries as one JSON object per line."""
+    entries = [
+        json.dumps(
+            {"date": date.strip(), "dot": dot, "text": " ".join(text.split())},
+            ensure_ascii=False,
+        )
+        for date, dot, text in (m.groups() for m in islice(_TL_PARTS_RE.finditer(html), limit))
+    ]
+    if entries:
+        return "\n".join(entries)
+    return extract_timeline_section(html)
+
 
+def compact_feed_for_prompt(feed_xml: str, limit: int = 5) -> str:
+    """Return the channel header and first feed items, whitespace collapsed.
+
+    The first item stays whole as a style example; later items keep their
+    structure but drop the description text, which is most of the bytes.
+    """
+    head_end = feed_xml.find("</description>")
+    items = [] if head_end == -1 else [
+        _INTER_TAG_WS_RE.sub("><", feed_xml[:head_end + len("</description>")].strip())
+    ]
+    for i, match in enumerate(islice(_FEED_ITEM_RE.finditer(feed_xml), limit)):
+        item = _INTER_TAG_WS_RE.sub("><", match.group(0))
+        if i:
+            item = _FEED_ITEM_DESCRIPTION_RE.sub("<description>...</description>", item)
+        items.append(item)
+    return "\n".join(items) if len(items) > 1 else feed_xml
+
+
+def insert_timeline_entries(html: str, new_entries: str) -> str:
+    """Insert new entries in chronological position (newest first by event date)."""
     # Extract date from the new entry
-    new_date_match = re.search(r'<div class="tl-date">(.*?)</div>', new_entries)
+    new_date_match = _TL_DATE_RE.search(new_entries)
     if not new_date_match:
         # Can't determine date, insert at top as fallback
-        marker = '<div class="timeline-title mono">'
-        idx = html.find(marker)
-        if idx != -1:
-            close_idx = html.find("</div>", idx)
-            if close_idx != -1:
-                insert_pos = close_idx + len("</div>")
-                return html[:insert_pos] + "\n" + new_entries + "\n" + html[insert_pos:]
-        return html
+        return insert_at_timeline_top(html, new_entries)
 
     new_date = parse_tl_date(new_date_match.group(1))
 
-    # Find all existing tl-item positions and their dates
-    existing_items = list(re.finditer(r'<div class="tl-item">', html))
-    if not existing_items:
+    # One pass over the page: (date, start, end) for every existing entry
+    items = [
+        (parse_tl_date(m.group(1)), m.start(), m.end())
+        for m in _TL_ITEM_FULL_RE.finditer(html)
+    ]
+    if not items:
         # No existing items, insert after timeline-title
-        marker = '<div class="timeline-title mono">'
-        idx = html.find(marker)
-        if idx != -1:
-            close_idx = html.find("</div>", idx)
-            if close_idx != -1:
-                insert_pos = close_idx + len("</div>")
-                return html[:insert_pos] + "\n" + new_entries + "\n" + html[insert_pos:]
-        return html
+        return insert_at_timeline_top(html, new_entries)
 
     # Find the right position: insert before the first entry with an older date
-    for item_match in existing_items:
-        item_start = item_match.start()
-        date_match = re.search(r'<div class="tl-date">(.*?)</div>', html[item_start:item_start+200])
-        if date_match:
-            existing_date = parse_tl_date(date_match.group(1))
-            if new_date >= existing_date:
-                # Insert before this item
-                return html[:item_start] + new_entries + "\n    " + html[item_start:]
-
-    # New entry is oldest — insert at the end (before the closing div of the timeline)
-    last_item = existing_items[-1]
-    # Find the end of the last tl-item block
-    search_from = last_item.start()
-    # Find closing </div></div></div> pattern for the last tl-item
-    end_of_last = html.find("</div>", html.find("</div>", html.find("</div>", search_from) + 1) + 1) + len("</div>")
-    return html[:end_of_last] + "\n    " + new_entries + "\n" + html[end_of_last:]
+    for existing_date, item_start, _ in items:
+        if new_date >= existing_date:
+            return f"{html[:item_start]}{new_entries}\n    {html[item_start:]}"
+
+    # New entry is oldest — insert right after the last entry
+    end_of_last = items[-1][2]
+    return f"{html[:end_of_last]}\n    {new_entries}\n{html[end_of_last:]}"
+
+
+def insert_at_timeline_top(html: str, new_entries: str) -> str:
+    """Insert entries directly below the timeline title."""
+    marker = '<div class="timeline-title mono">'
+    idx = html.find(marker)
+    if idx != -1:
+        close_idx = html.find("</div>", idx)
+        if close_idx != -1:
+            insert_pos = close_idx + len("</div>")
+            return f"{html[:insert_pos]}\n{new_entries}\n{html[insert_pos:]}"
+    return html
 
 
 def remove_old_new_tags(html: str) -> str:
     """Remove existing 'New' tags so only the fresh entries have them."""
-    # Match the actual class used in the site
-    html = re.sub(r'\s*<span class="tl-new">New</span>', '', html)
-    # Also catch any old-style tags just in case
-    html = re.sub(r'\s*<span class="timeline-tag new">New</span>', '', html)
+    for tag in _NEW_TAGS:
+        # Cheap substring check first: most runs have nothing to strip
+        if tag not in html:
+            continue
+        # Drop each tag along with the whitespace in front of it
+        parts = html.split(tag)
+        html = "".join([part.rstrip() for part in parts[:-1]] + parts[-1:])
     return html
 
 
-def update_stats(html: str, stats: dict) -> str:
-    """Update stat numbers. Pattern depends on site HTML structure."""
-    if not stats:
+def update_page_fields(html: str, stats: dict, date_str: str, month_year: str) -> str:
+    """Update stat numbers and last-updated dates in a single pass over the HTML."""
+    # data-stat attribute -> new value, only for stats that actually changed
+    lookup = {
+        attr: stats[key]
+        for attr, key in _STAT_KEY_BY_ATTR.items()
+        if stats.get(key) is not None
+    } if stats else {}
+    # Re-runs usually find both dates already current; nothing to rewrite then
+    if date_str and f"Last updated: {date_str}" in html and f"Data as of {month_year}" in html:
+        date_str = ""
+    if not lookup and not date_str:
         return html
-    for key, value in stats.items():
-        if value is None:
-            continue
-        if key == "states_sued":
-            html = re.sub(r'(data-stat="sued"[^>]*>)\s*(\d+)', f'\\g<1>{value}', html)
-        elif key == "states_complied":
-            html = re.sub(r'(data-stat="complied"[^>]*>)\s*(\d+)', f'\\g<1>{value}', html)
-        elif key == "court_wins_merits":
-            html = re.sub(r'(data-stat="court"[^>]*>)\s*(\d+)', f'\\g<1>{value}', html)
-        elif key == "states_contacted":
-            html = re.sub(r'(data-stat="contacted"[^>]*>)\s*(\d+)', f'\\g<1>{value}', html)
-    return html
-
 
-def update_last_updated(html: str, date_str: str) -> str:
-    """Update last-updated dates in the HTML."""
-    html = re.sub(
-        r'(Last updated[:\s]*)\w+ \d{1,2}, \d{4}',
-        f'\\g<1>{date_str}',
-        html,
-        flags=re.IGNORECASE,
-    )
-    html = re.sub(
-        r'(Data as of )\w+ \d{4}',
-        f'\\g<1>{datetime.now().strftime("%B %Y")}',
-        html,
-    )
-    return html
+    def replace(match):
+        if match.group("stat"):
+            value = lookup.get(match.group("attr"))
+            if value is None:
+                return match.group(0)
+            return f"{match.group('stat')}{value}"
+        if not date_str:
+            return match.group(0)
+        if match.group("updated"):
+            return f"{match.group('updated')}{date_str}"
+        return f"{match.group('as_of')}{month_year}"
+
+    return _PAGE_FIELDS_RE.sub(replace, html)
+
+
+def find_between(text: str, open_tag: str, close_tag: str):
+    """Return the (start, end) offsets of the first open_tag...close_tag content, or None."""
+    start = text.find(open_tag)
+    if start == -1:
+        return None
+    start += len(open_tag)
+    end = text.find(close_tag, start)
+    if end == -1:
+        return None
+    return start, end
+
+
+def apply_edits(text: str, edits: list) -> str:
+    """Apply non-overlapping (start, end, replacement) edits with a single join."""
+    parts = []
+    last = 0
+    for start, end, replacement in sorted(edits):
+        parts.append(text[last:start])
+        parts.append(replacement)
+        last = end
+    parts.append(text[last:])
+    return "".join(parts)
 
 
 def insert_feed_items(feed_xml: str, new_items: str, last_build_date: str) -> str:
-    """Insert new items into feed.xml."""
+    """Insert new items into feed.xml (and bump lastBuildDate) in one rebuild."""
+    edits = []
     if last_build_date:
-        feed_xml = re.sub(
-            r'<lastBuildDate>.*?</lastBuildDate>',
-            f'<lastBuildDate>{last_build_date}</lastBuildDate>',
-            feed_xml,
-        )
-    # Insert after the channel's </description>
-    match = re.search(r'(</description>\s*\n)', feed_xml)
-    if match:
-        pos = match.end()
-        feed_xml = feed_xml[:pos] + new_items + "\n" + feed_xml[pos:]
+        span = find_between(feed_xml, "<lastBuildDate>", "</lastBuildDate>")
+        if span:
+            edits.append((*span, last_build_date))
+    # Insert after the line ending that follows the channel's </description>
+    idx = feed_xml.find("</description>")
+    if idx != -1:
+        end = idx + len("</description>")
+        ws_end = end
+        while ws_end < len(feed_xml) and feed_xml[ws_end].isspace():
+            ws_end += 1
+        idx = feed_xml.rfind("\n", end, ws_end)
+    if idx != -1:
+        edits.append((idx + 1, idx + 1, f"{new_items}\n"))
     else:
         print("WARNING: Could not find insertion point in feed.xml", file=sys.stderr)
-    return feed_xml
+    return apply_edits(feed_xml, edits)
 
 
 def update_monitor_timeline(monitor_py: str, new_lines: str) -> str:
@@ -465,6 +714,12 @@ def update_monitor_timeline(monitor_py: str, new_lines: str) -> str:
 # ---------------------------------------------------------------------------
 # Buttondown — uses http.client to avoid urllib's latin-1 header encoding bug
 # ---------------------------------------------------------------------------
+_BUTTONDOWN_HEADERS = {
+    "Authorization": f"Token {BUTTONDOWN_API_KEY}",
+    "Content-Type": "application/json; charset=utf-8",
+}
+
+
 def send_buttondown_email(subject: str, body: str) -> bool:
     """Send email via Buttondown API. Uses http.client for proper UTF-8 support."""
     if not BUTTONDOWN_API_KEY:
@@ -480,29 +735,28 @@ def send_buttondown_email(subject: str, body: str) -> bool:
             "body": body,
             "status": "about_to_send",
         }
-        json_data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        if subject.isascii() and body.isascii():
+            json_data = json.dumps(payload, separators=JSON_SEPARATORS).encode("ascii")
+        else:
+            json_data = json.dumps(payload, ensure_ascii=False, separators=JSON_SEPARATORS).encode("utf-8")
 
-        conn = http.client.HTTPSConnection("api.buttondown.com", timeout=30)
-        conn.request(
+        # No retries: a 5xx after the send was accepted must not send it twice
+        status, resp_body = https_request(
+            "api.buttondown.com",
             "POST",
             "/v1/emails",
-            body=json_data,
-            headers={
-                "Authorization": f"Token {BUTTONDOWN_API_KEY}",
-                "Content-Type": "application/json; charset=utf-8",
-                "Content-Length": str(len(json_data)),
-            },
+            json_data,
+            _BUTTONDOWN_HEADERS,
+            retries=1,
         )
-        resp = conn.getresponse()
-        resp_body = resp.read().decode("utf-8")
-        conn.close()
 
-        if resp.status in (200, 201):
+        if status in (200, 201):
+            # json.loads detects UTF-8 in bytes; no separate decode pass
             result = json.loads(resp_body)
             print(f"Buttondown email sent: {result.get('id', '?')}")
             return True
         else:
-            print(f"Buttondown API error {resp.status}: {resp_body}", file=sys.stderr)
+            print(f"Buttondown API error {status}: {resp_body.decode('utf-8', 'replace')}", file=sys.stderr)
             return False
     except Exception as e:
         print(f"Buttondown error: {e}", file=sys.stderr)
@@ -512,49 +766,53 @@ def send_buttondown_email(subject: str, body: str) -> bool:
 # ---------------------------------------------------------------------------
 # GitHub issue management
 # ---------------------------------------------------------------------------
-def comment_and_close_issue(comment: str):
-    """Comment on the issue and close it."""
+_GITHUB_HEADERS = {
+    "Accept": "application/vnd.github+json",
+    "Authorization": f"Bearer {GITHUB_TOKEN}",
+    "Content-Type": "application/json",
+    "User-Agent": "election-map-bot",
+}
+
+
+def github_issue_request(method: str, payload: dict, suffix: str = "") -> int:
+    """Send one JSON request for this run's issue and return the HTTP status."""
+    status, _ = https_request(
+        "api.github.com",
+        method,
+        f"/repos/{GITHUB_REPO}/issues/{ISSUE_NUMBER}{suffix}",
+        json.dumps(payload, separators=JSON_SEPARATORS).encode("utf-8"),
+        _GITHUB_HEADERS,
+    )
+    return status
+
+
+def comment_on_issue(comment: str):
+    """Post the run summary as a comment on the issue."""
     if not GITHUB_TOKEN or not GITHUB_REPO or not ISSUE_NUMBER:
         print(f"Would comment: {comment[:200]}...")
         return
-
-    # Comment
-    payload = {"body": comment}
-    data = json.dumps(payload).encode("utf-8")
-    req = urllib.request.Request(
-        f"https://api.github.com/repos/{GITHUB_REPO}/issues/{ISSUE_NUMBER}/comments",
-        data=data,
-        headers={
-            "Accept": "application/vnd.github+json",
-            "Authorization": f"Bearer {GITHUB_TOKEN}",
-            "Content-Type": "application/json",
-        },
-        method="POST",
-    )
     try:
-        with urllib.request.urlopen(req, timeout=30):
+        status = github_issue_request("POST", {"body": comment}, "/comments")
+        if status in (200, 201):
             print(f"Comment added to issue #{ISSUE_NUMBER}")
-    except urllib.error.HTTPError as e:
-        print(f"GitHub comment error: {e.code}", file=sys.stderr)
-
-    # Close
-    payload = {"state": "closed"}
-    data = json.dumps(payload).encode("utf-8")
-    req = urllib.request.Request(
-        f"https://api.github.com/repos/{GITHUB_REPO}/issues/{ISSUE_NUMBER}",
-        data=data,
-        headers={
-            "Accept": "application/vnd.github+json",
-            "Authorization": f"Bearer {GITHUB_TOKEN}",
-            "Content-Type": "application/json",
-        },
-        method="PATCH",
-    )
+        else:
+            print(f"GitHub comment error: {status}", file=sys.stderr)
+    except (OSError, http.client.HTTPException) as e:
+        print(f"GitHub comment error: {e}", file=sys.stderr)
+
+
+def close_issue():
+    """Close the issue."""
+    if not GITHUB_TOKEN or not GITHUB_REPO or not ISSUE_NUMBER:
+        return
     try:
-        with urllib.request.urlopen(req, timeout=30):
+        status = github_issue_request("PATCH", {"state": "closed"})
+        if status == 200:
             print(f"Issue #{ISSUE_NUMBER} closed")
-    except urllib.error.HTTPError as e:
-        print(f"GitHub close error: {e.code}", file=sys.stderr)
+        else:
+            print(f"GitHub close error: {status}", file=sys.stderr)
+    except (OSError, http.client.HTTPException) as e:
+        print(f"GitHub close error: {e}", file=sys.stderr)
 
 
 # ---------------------------------------------------------------------------
@@ -568,25 +826,24 @@ def main():
         print("Error: No issue body provided.", file=sys.stderr)
         sys.exit(1)
 
+    # One clock read per run keeps every "Data as of" rewrite consistent
+    now_month_year = datetime.now(timezone.utc).strftime("%B %Y")
     mode = detect_mode(COMMENT_BODY)
     print(f"Mode: {'approved with edits' if mode == 'with_edits' else 'approved (clean)'}")
     print(f"Comment length: {len(COMMENT_BODY)} chars")
     print(f"Comment preview: {COMMENT_BODY[:150]}...")
 
-    # Read current files
+    # Read the files the prompt needs; monitor.py is only read if Claude asks for it
     print("Reading current site files...")
     try:
-        with open("index.html", "r") as f:
-            html = f.read()
-        with open("feed.xml", "r") as f:
-            feed_xml = f.read()
-        with open("scripts/monitor.py", "r") as f:
-            monitor_py = f.read()
+        files = read_site_files("html", "feed")
     except FileNotFoundError as e:
         print(f"Error reading file: {e}", file=sys.stderr)
         sys.exit(1)
+    html, feed_xml = files["html"], files["feed"]
 
-    timeline_html = extract_timeline_section(html)
+    timeline = compact_timeline_for_prompt(html)
+    feed_items = compact_feed_for_prompt(feed_xml)
 
     # --- MODE: APPROVED WITH EDITS ---
     if mode == "with_edits":
@@ -606,67 +863,79 @@ def main():
             print("  Your email text here", file=sys.stderr)
 
         # Call Claude with corrections to generate site updates (no email)
-        print("Calling Claude to generate corrected site updates...")
+        if edits["corrections"]:
+            print("Calling Claude to generate corrected site updates...")
+        else:
+            print("No corrections — calling Claude for site updates only (email from comment)...")
         user_prompt = build_edits_prompt(
-            ISSUE_BODY, edits["corrections"], timeline_html, feed_xml
+            ISSUE_BODY, edits["corrections"], timeline, feed_items
         )
-        response = call_claude(SYSTEM_PROMPT, user_prompt)
-        updates = parse_json_response(extract_text(response))
-
-        # Email comes from the human's comment, not Claude
-        email_subject = edits["email_subject"]
-        email_body = edits["email_body"]
 
     # --- MODE: APPROVED (CLEAN) ---
     else:
         print("Calling Claude to generate updates and email...")
-        user_prompt = build_clean_prompt(ISSUE_BODY, timeline_html, feed_xml)
-        response = call_claude(SYSTEM_PROMPT, user_prompt)
-        updates = parse_json_response(extract_text(response))
+        user_prompt = build_clean_prompt(ISSUE_BODY, timeline, feed_items)
 
-        email_subject = updates.get("email_subject", "")
-        email_body = updates.get("email_body", "")
+    response = call_claude(SYSTEM_PROMPT, user_prompt)
+    updates = normalize_updates(parse_json_response(extract_text(response)))
+
+    if mode == "with_edits":
+        # Email comes from the human's comment, not Claude
+        email_subject = edits["email_subject"]
+        email_body = edits["email_body"]
+    else:
+        email_subject = updates["email_subject"]
+        email_body = updates["email_body"]
 
     # --- APPLY SITE UPDATES ---
     print("Applying updates to index.html...")
     html = remove_old_new_tags(html)
     if updates.get("new_timeline_entries_html"):
         html = insert_timeline_entries(html, updates["new_timeline_entries_html"])
-    if updates.get("stat_updates"):
-        html = update_stats(html, updates["stat_updates"])
-    if updates.get("last_updated_date"):
-        html = update_last_updated(html, updates["last_updated_date"])
+    html = update_page_fields(
+        html,
+        updates.get("stat_updates"),
+        updates.get("last_updated_date"),
+        now_month_year,
+    )
 
     print("Applying updates to feed.xml...")
     if updates.get("new_feed_items_xml"):
         feed_xml = insert_feed_items(
             feed_xml,
             updates["new_feed_items_xml"],
-            updates.get("feed_last_build_date", ""),
+            updates["feed_last_build_date"],
         )
 
+    updated = {"html": html, "feed": feed_xml}
     print("Updating monitor.py...")
     if updates.get("monitor_timeline_additions"):
-        monitor_py = update_monitor_timeline(monitor_py, updates["monitor_timeline_additions"])
+        files["monitor"] = read_file(SITE_FILES["monitor"])
+        updated["monitor"] = update_monitor_timeline(
+            files["monitor"], updates["monitor_timeline_additions"]
+        )
 
-    # Write files
+    # Write files (only the ones whose content changed)
     print("Writing updated files...")
-    with open("index.html", "w") as f:
-        f.write(html)
-    with open("feed.xml", "w") as f:
-        f.write(feed_xml)
-    with open("scripts/monitor.py", "w") as f:
-        f.write(monitor_py)
+    changed = {name: text for name, text in updated.items() if text != files[name]}
+    if changed:
+        write_site_files(changed)
 
     # --- SEND EMAIL (non-fatal — site updates already written) ---
-    print("Sending email via Buttondown...")
-    try:
-        email_sent = send_buttondown_email(email_subject, email_body)
-    except Exception as e:
-        print(f"Email failed (non-fatal): {e}", file=sys.stderr)
-        email_sent = False
-
-    # --- CLOSE ISSUE ---
+    # Closing the issue doesn't depend on the email, so it runs alongside;
+    # the summary comment reports the email result and has to wait for it.
+    print("Sending email via Buttondown and closing issue...")
+    with ThreadPoolExecutor(max_workers=1) as ex:
+        close_future = ex.submit(close_issue)
+        try:
+            email_sent = send_buttondown_email(email_subject, email_body)
+        except Exception as e:
+            print(f"Email failed (non-fatal): {e}", file=sys.stderr)
+            email_sent = False
+        # Surface anything close_issue didn't handle instead of losing it in the thread
+        close_future.result()
+
+    # --- COMMENT ON ISSUE ---
     changes = []
     if updates.get("new_timeline_entries_html"):
         changes.append("Added timeline entries")
@@ -678,27 +947,31 @@ def main():
         changes.append("Email sent via Buttondown")
     else:
         changes.append("Email skipped (missing API key, empty content, or error)")
-    if mode == "with_edits":
+    corrected = mode == "with_edits" and bool(edits["corrections"])
+    if corrected:
         changes.append("Applied human corrections (approved with edits)")
+    elif mode == "with_edits":
+        changes.append("Used the human-drafted email (approved with edits)")
+    changes_md = "\n".join("- " + c for c in changes)
 
-    summary = f"""Update applied{'  with corrections' if mode == 'with_edits' else ''}.
+    summary = f"""Update applied{' with corrections' if corrected else ''}.
 
 Mode: {'approved with edits' if mode == 'with_edits' else 'approved'}
 
 Changes:
-{chr(10).join(f'- {c}' for c in changes)}
+{changes_md}
 
 Email subject: {email_subject or '(none)'}
 
-Last updated: {updates.get('last_updated_date', 'N/A')}
+Last updated: {updates['last_updated_date'] or 'N/A'}
 
 To deploy: git pull in your site folder, then drag to Netlify.
 
 ---
 Applied by election-map-bot."""
 
-    print("Commenting and closing issue...")
-    comment_and_close_issue(summary)
+    print("Commenting on issue...")
+    comment_on_issue(summary)
     print("Done!")
 
 
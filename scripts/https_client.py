@@ -0,0 +1,82 @@
+"""
+Election Risk Map — shared HTTPS helpers for monitor.py and apply_update.py
+
+One kept-alive connection per host, shared by every call to it, with
+retries on 429/5xx and on connections the server has already dropped,
+plus the error handling both scripts apply to the responses.
+"""
+
+import json
+import sys
+import time
+
+# http.client (which pulls in ssl) is imported where it's used, so importing
+# this module doesn't slow monitor.py's missing-key exit
+
+RETRY_STATUSES = {429, 500, 502, 503, 504, 529}
+JSON_SEPARATORS = (",", ":")  # compact request bodies: no padding after , and :
+_CONNECTIONS = {}
+
+
+def https_request(host: str, method: str, path: str, body: bytes, headers: dict,
+                  timeout: int = 30, retries: int = 3) -> tuple:
+    """Send a request over a kept-alive connection to host; return (status, body).
+
+    429/5xx responses are retried with exponential backoff on the same
+    connection. A reused (or pre-warmed) connection that the server has
+    since closed fails on first use; that case is retried straight away on
+    a fresh connection. Timeouts and errors on a fresh connection are raised.
+    Each host must only be used from one thread at a time.
+    """
+    import http.client
+
+    for attempt in range(retries):
+        conn = _CONNECTIONS.get(host)
+        reused = conn is not None
+        if conn is None:
+            conn = _CONNECTIONS[host] = http.client.HTTPSConnection(host, timeout=timeout)
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            resp = conn.getresponse()
+            data = resp.read()
+        except (OSError, http.client.HTTPException) as e:
+            # Never leave a broken connection behind for the next call
+            conn.close()
+            _CONNECTIONS.pop(host, None)
+            # Only a kept-alive socket the server had already dropped is safe to
+            # resend on; a timeout, or any error on a fresh connection, may come
+            # after the server acted on the request
+            stale = isinstance(e, (
+                http.client.RemoteDisconnected,
+                http.client.CannotSendRequest,
+                BrokenPipeError,
+                ConnectionResetError,
+            ))
+            if not (reused and stale) or attempt == retries - 1:
+                raise
+            continue
+        if resp.status not in RETRY_STATUSES or attempt == retries - 1:
+            return resp.status, data
+        time.sleep(0.5 * 2 ** attempt)
+
+
+def json_or_exit(service: str, status: int, body: bytes, ok: tuple = (200, 201)) -> dict:
+    """Decode a successful JSON response, or report the error and exit."""
+    if status not in ok:
+        print(f"{service} API error {status}: {body.decode('utf-8', 'replace')}", file=sys.stderr)
+        sys.exit(1)
+    # json.loads detects UTF-8 in bytes; no separate decode pass
+    return json.loads(body)
+
+
+def warm_connection(host: str, timeout: int = 30):
+    """Open the TCP + TLS connection to host ahead of its first request."""
+    import http.client
+
+    conn = http.client.HTTPSConnection(host, timeout=timeout)
+    try:
+        conn.connect()
+    except OSError:
+        # The real request connects (and reports errors) on its own
+        return
+    _CONNECTIONS[host] = conn
@@ -17,9 +17,16 @@ Requires env vars:
 import os
 import sys
 import json
-import urllib.request
-import urllib.error
+import io
+import re
 from datetime import datetime, timezone
+from functools import lru_cache
+from html.parser import HTMLParser
+
+from https_client import JSON_SEPARATORS, https_request, json_or_exit, warm_connection
+
+# hashlib, http.client (which pulls in ssl) and concurrent.futures are
+# imported where they're used, so the missing-key exit stays fast
 
 # ---------------------------------------------------------------------------
 # Config
@@ -29,61 +36,156 @@ GITHUB_TOKEN = os.environ.get("GITHUB_TOKEN", "")
 GITHUB_REPO = os.environ.get("GITHUB_REPOSITORY", "")
 CLAUDE_MODEL = "claude-sonnet-4-20250514"
 MAX_TOKENS = 4096
+REPO_ROOT = os.path.normpath(os.path.join(os.path.dirname(__file__), ".."))
+INDEX_PATH = os.path.join(REPO_ROOT, "index.html")
+
+# Extracted site state, keyed by a hash of this script and index.html, so
+# any change to the extraction code invalidates it on its own
+CACHE_DIR = os.path.join(REPO_ROOT, ".monitor-cache")
+
+# The page lists the timeline newest first; older entries add prompt tokens
+# without helping Claude avoid duplicates
+MAX_TIMELINE_ENTRIES = 60
+MAX_ENTRY_CHARS = 140
+
+# ---------------------------------------------------------------------------
+# What to read from index.html
+# ---------------------------------------------------------------------------
+# <div> classes whose text describes what's already on the site, as pairs:
+# the first field of each entry -> the field that completes it
+SITE_FIELD_PAIRS = {
+    "tl-date": "tl-text",
+    "court-state": "court-detail",
+    "stat-num": "stat-label",
+}
+_PAIR_FIRST = {second: first for first, second in SITE_FIELD_PAIRS.items()}
+# The complied states live in the inline JS map, not in the markup; matched
+# on the raw bytes (\w is ASCII-only there, as state codes are)
+_COMPLIED_RE = re.compile(rb'(\w{2}):\{name:"[^"]+",risk:"complied"')
 
 # ---------------------------------------------------------------------------
 # Auto-extract current site state from index.html (no manual maintenance)
 # ---------------------------------------------------------------------------
 def get_current_timeline() -> str:
-    """Parse index.html to extract what's already on the site."""
-    index_path = os.path.join(os.path.dirname(__file__), "..", "index.html")
-    if not os.path.exists(index_path):
-        # Try repo root
-        index_path = os.path.join(os.path.dirname(__file__), "..", "index.html")
-    if not os.path.exists(index_path):
+    """Return what's already on the site, reusing the cached summary if index.html is unchanged."""
+    import hashlib
+
+    try:
+        with open(INDEX_PATH, "rb") as f:
+            raw = f.read()
+    except FileNotFoundError:
         return "(Could not read index.html — flag everything as potentially new)"
 
-    with open(index_path, "r", encoding="utf-8") as f:
-        html = f.read()
+    with open(__file__, "rb") as f:
+        source = f.read()
+    key = hashlib.sha256(source + raw).hexdigest()[:16]
+    cache_path = os.path.join(CACHE_DIR, f"{key}.txt")
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            return f.read()
+    except OSError:
+        pass
 
+    summary = summarize_site(raw)
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(cache_path, "w", encoding="utf-8") as f:
+            f.write(summary)
+        # Only the current entry can ever hit again
+        for name in os.listdir(CACHE_DIR):
+            if name != f"{key}.txt":
+                os.remove(os.path.join(CACHE_DIR, name))
+    except OSError as e:
+        print(f"Could not write site cache: {e}", file=sys.stderr)
+    return summary
+
+
+class SiteFieldParser(HTMLParser):
+    """Collect (first, second) text pairs for every entry in SITE_FIELD_PAIRS.
+
+    Text is buffered only while inside one of those divs (nested tags are
+    dropped, nested divs are tracked so the right </div> closes the field).
+    Each completing field is paired with the first field just before it, so
+    a stray field can't shift every later pair out of line.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.pairs = {first: [] for first in SITE_FIELD_PAIRS}
+        self._pending = {}    # first field's text, waiting for its partner
+        self._current = None  # class of the field being read, if any
+        self._depth = 0       # divs opened inside the current field
+        self._text = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag != "div":
+            return
+        if self._current is not None:
+            self._depth += 1
+            return
+        cls = dict(attrs).get("class")
+        if cls in SITE_FIELD_PAIRS or cls in _PAIR_FIRST:
+            self._current = cls
+
+    def handle_endtag(self, tag):
+        if tag != "div" or self._current is None:
+            return
+        if self._depth:
+            self._depth -= 1
+            return
+        value = "".join(self._text).strip()
+        if self._current in SITE_FIELD_PAIRS:
+            self._pending[self._current] = value
+        else:
+            first = _PAIR_FIRST[self._current]
+            if first in self._pending:
+                self.pairs[first].append((self._pending.pop(first), value))
+        self._current = None
+        self._text = []
+
+    def handle_data(self, data):
+        if self._current is not None:
+            self._text.append(data)
+
+
+def summarize_site(raw: bytes) -> str:
+    """Parse index.html's bytes to extract what's already on the site."""
     lines = ["Already on the site (do NOT re-report these):\n"]
 
-    # Extract timeline entries
-    import re
-    tl_dates = re.findall(r'class="tl-date">([^<]+)</div>', html)
-    tl_texts = re.findall(r'class="tl-text">(.*?)</div>', html, re.DOTALL)
-    for date, text in zip(tl_dates, tl_texts):
-        clean = re.sub(r'<[^>]+>', '', text).strip()
-        lines.append(f"- {date}: {clean}")
+    # One streaming parse collects every entry, already paired
+    parser = SiteFieldParser()
+    parser.feed(raw.decode("utf-8"))
+    parser.close()
+    pairs = parser.pairs
+
+    # Extract timeline entries (newest only, long ones shortened)
+    for date, text in pairs["tl-date"][:MAX_TIMELINE_ENTRIES]:
+        if len(text) > MAX_ENTRY_CHARS:
+            text = text[:MAX_ENTRY_CHARS - 1].rstrip() + "…"
+        lines.append(f"- {date}: {text}")
 
     # Extract court wins
-    court_states = re.findall(r'class="court-state">(.*?)</div>', html, re.DOTALL)
-    court_details = re.findall(r'class="court-detail">(.*?)</div>', html, re.DOTALL)
-    if court_states:
+    if pairs["court-state"]:
         lines.append("\nCourt rulings already tracked:")
-    for state, detail in zip(court_states, court_details):
-        clean_state = re.sub(r'<[^>]+>', '', state).strip()
-        clean_detail = re.sub(r'<[^>]+>', '', detail).strip()
-        lines.append(f"- {clean_state}: {clean_detail}")
+    for state, detail in pairs["court-state"]:
+        lines.append(f"- {state}: {detail}")
 
     # Extract stat numbers
-    stat_nums = re.findall(r'class="stat-num">([^<]+)</div>', html)
-    stat_labels = re.findall(r'class="stat-label">([^<]+)</div>', html)
-    if stat_nums:
+    if pairs["stat-num"]:
         lines.append("\nCurrent stats on site:")
-    for num, label in zip(stat_nums, stat_labels):
+    for num, label in pairs["stat-num"]:
         lines.append(f"- {num} {label}")
 
     # Extract complied states from JS
-    complied = re.findall(r'(\w{2}):\{name:"[^"]+",risk:"complied"', html)
+    complied = sorted(code.decode("ascii") for code in _COMPLIED_RE.findall(raw))
     if complied:
-        lines.append(f"\nStates marked as complied: {', '.join(sorted(complied))}")
+        lines.append(f"\nStates marked as complied: {', '.join(complied)}")
 
     return "\n".join(lines)
 
 
-CURRENT_TIMELINE = get_current_timeline()
-
-SEARCH_PROMPT = f"""You are a fact-checker for electionriskmap.org, a nonpartisan site tracking
+# The search prompt, split around the site summary spliced in by build_prompt
+_PROMPT_HEAD = """You are a fact-checker for electionriskmap.org, a nonpartisan site tracking
 federal election interference risks ahead of the 2026 midterms.
 
 Your job is to search for NEW developments that are NOT already on the site.
@@ -95,7 +197,8 @@ Focus on:
 5. New threats to election officials or voting access
 6. Calls to action / new resources for voters
 
-{CURRENT_TIMELINE}
+"""
+_PROMPT_TAIL = """
 
 INSTRUCTIONS:
 1. Search for recent election interference news (last 7 days)
@@ -106,10 +209,10 @@ INSTRUCTIONS:
 6. Do NOT report opinion pieces, speculation, or predictions — only concrete events
 
 Respond in this exact JSON format (no markdown, no backticks, just raw JSON):
-{{
+{
   "search_date": "YYYY-MM-DD",
   "findings": [
-    {{
+    {
       "headline": "Short headline",
       "date": "YYYY-MM-DD or approximate",
       "description": "2-3 sentence factual description",
@@ -117,22 +220,27 @@ Respond in this exact JSON format (no markdown, no backticks, just raw JSON):
       "affected_states": ["XX", "YY"],
       "confidence": "HIGH|MEDIUM",
       "sources": [
-        {{"name": "Source Name", "url": "https://..."}},
-        {{"name": "Source Name 2", "url": "https://..."}}
+        {"name": "Source Name", "url": "https://..."},
+        {"name": "Source Name 2", "url": "https://..."}
       ],
       "suggested_timeline_entry": "Short text for the timeline",
       "suggested_risk_changes": "Any state risk level changes needed, or 'none'"
-    }}
+    }
   ],
   "no_updates": false,
   "summary": "1-2 sentence summary of what was found (or 'No new verified developments found.')"
-}}
+}
 
 If nothing new is found, set "findings" to an empty array and "no_updates" to true.
 Be conservative. Only include developments you are confident actually happened.
 """
 
 
+def build_prompt(timeline: str) -> str:
+    """Return the search prompt with the current site summary in place."""
+    return "".join((_PROMPT_HEAD, timeline, _PROMPT_TAIL))
+
+
 def call_claude(prompt: str) -> dict:
     """Call Claude API with web search enabled."""
     payload = {
@@ -142,25 +250,21 @@ def call_claude(prompt: str) -> dict:
         "messages": [{"role": "user", "content": prompt}],
     }
 
-    data = json.dumps(payload).encode("utf-8")
-    req = urllib.request.Request(
-        "https://api.anthropic.com/v1/messages",
-        data=data,
-        headers={
+    # json.dumps escapes non-ASCII by default, so the ASCII codec always applies
+    data = json.dumps(payload, separators=JSON_SEPARATORS).encode("ascii")
+    status, body = https_request(
+        "api.anthropic.com",
+        "POST",
+        "/v1/messages",
+        data,
+        {
             "Content-Type": "application/json",
             "x-api-key": ANTHROPIC_API_KEY,
             "anthropic-version": "2023-06-01",
         },
-        method="POST",
+        timeout=120,
     )
-
-    try:
-        with urllib.request.urlopen(req, timeout=120) as resp:
-            return json.loads(resp.read().decode("utf-8"))
-    except urllib.error.HTTPError as e:
-        body = e.read().decode("utf-8") if e.fp else ""
-        print(f"Claude API error {e.code}: {body}", file=sys.stderr)
-        sys.exit(1)
+    return json_or_exit("Claude", status, body, ok=(200,))
 
 
 def extract_text(response: dict) -> str:
@@ -172,103 +276,144 @@ def extract_text(response: dict) -> str:
     return "\n".join(parts)
 
 
+_JSON_DECODER = json.JSONDecoder()
+_FINDINGS_KEYS = ("findings", "no_updates")
+
+
+def parse_findings_from_blocks(blocks: list):
+    """Decode the findings object from Claude's text blocks, or return None.
+
+    The blocks are stitched back together first, since citations can split
+    the object across them. Each "{" is then tried with raw_decode, which
+    stops where the object closes, so trailing prose is never parsed. An
+    object without a "findings" or "no_updates" key (an example in the
+    prose, say) is skipped whole. Returns None if no such object decodes,
+    leaving parse_findings as the fallback.
+    """
+    text = "".join(b["text"] for b in blocks if b.get("type") == "text")
+    start = text.find("{")
+    while start != -1:
+        try:
+            obj, end = _JSON_DECODER.raw_decode(text, start)
+        except json.JSONDecodeError:
+            end = start + 1
+        else:
+            if isinstance(obj, dict) and any(k in obj for k in _FINDINGS_KEYS):
+                return obj
+        start = text.find("{", end)
+    return None
+
+
 def parse_findings(text: str) -> dict:
-    """Parse JSON from Claude's response, stripping any markdown fencing."""
-    cleaned = text.strip()
-    if cleaned.startswith("```"):
-        cleaned = cleaned.split("\n", 1)[1] if "\n" in cleaned else cleaned[3:]
-    if cleaned.endswith("```"):
-        cleaned = cleaned[:-3]
-    cleaned = cleaned.strip()
-    # Find the JSON object
-    start = cleaned.find("{")
-    end = cleaned.rfind("}") + 1
-    if start == -1 or end == 0:
+    """Parse the JSON object in Claude's response text.
+
+    Slicing from the first "{" to the last "}" also drops any markdown
+    fencing or surrounding prose, so no separate fence stripping is needed.
+    """
+    # Only the (immutable) slice is cached; each call decodes a fresh dict,
+    # so nothing a caller changes leaks into the next call's result
+    raw = _findings_json(text)
+    if raw is None:
         return {"findings": [], "no_updates": True, "summary": "Failed to parse response."}
     try:
-        return json.loads(cleaned[start:end])
+        return json.loads(raw)
     except json.JSONDecodeError as e:
         print(f"JSON parse error: {e}", file=sys.stderr)
-        print(f"Raw text: {cleaned[start:end][:500]}", file=sys.stderr)
+        print(f"Raw text: {raw[:500]}", file=sys.stderr)
         return {"findings": [], "no_updates": True, "summary": "Failed to parse response."}
 
 
+@lru_cache(maxsize=32)
+def _findings_json(text: str):
+    start = text.find("{")
+    end = text.rfind("}") + 1
+    if start == -1 or end <= start:
+        return None
+    return text[start:end]
+
+
+# Fixed closing sections of the issue body
+_NO_UPDATES_FOOTER = """
+---
+*This scan checked Brennan Center, DOJ press releases, Votebeat, \
+Democracy Docket, NPR, and other election news sources.*"""
+
+_NEXT_STEPS_FOOTER = """---
+
+### What to do next
+
+If these updates are accurate and should be added to the site:
+1. Comment `approved` on this issue
+2. Open a conversation with Claude and say: \
+"Update electionriskmap.org with the findings from Issue #[this number]"
+3. Claude will update the site, RSS feed, and draft an email blast
+
+If any finding looks wrong, comment with corrections before approving.
+
+---
+*Automated scan by electionriskmap.org monitoring pipeline. \
+All findings require human approval before going live.*"""
+
+
 def format_issue_body(data: dict) -> str:
     """Format findings into a GitHub Issue body."""
     now = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M UTC")
-    lines = [
-        f"## Automated Election Update Scan — {now}",
-        "",
-    ]
+    buf = io.StringIO()
+    w = buf.write
+    w(f"## Automated Election Update Scan — {now}\n")
+    w("\n")
 
     if data.get("no_updates") or not data.get("findings"):
-        lines.append("### No new verified developments found.")
-        lines.append("")
-        lines.append(f"**Summary:** {data.get('summary', 'No updates.')}")
-        lines.append("")
-        lines.append("---")
-        lines.append("*This scan checked Brennan Center, DOJ press releases, Votebeat, "
-                      "Democracy Docket, NPR, and other election news sources.*")
-        return "\n".join(lines)
-
-    lines.append(f"**Summary:** {data.get('summary', '')}")
-    lines.append("")
-    lines.append(f"### {len(data['findings'])} Update(s) Found")
-    lines.append("")
+        w("### No new verified developments found.\n")
+        w("\n")
+        w(f"**Summary:** {data.get('summary', 'No updates.')}\n")
+        w(_NO_UPDATES_FOOTER)
+        return buf.getvalue()
+
+    w(f"**Summary:** {data.get('summary', '')}\n")
+    w("\n")
+    w(f"### {len(data['findings'])} Update(s) Found\n")
+    w("\n")
 
     for i, f in enumerate(data["findings"], 1):
         confidence_emoji = "🟢" if f.get("confidence") == "HIGH" else "🟡"
-        lines.append(f"---")
-        lines.append(f"")
-        lines.append(f"#### {i}. {f.get('headline', 'Update')}")
-        lines.append(f"")
-        lines.append(f"**Date:** {f.get('date', 'Unknown')}  ")
-        lines.append(f"**Confidence:** {confidence_emoji} {f.get('confidence', 'UNKNOWN')} "
-                      f"({len(f.get('sources', []))} sources)  ")
-        lines.append(f"**Category:** {f.get('category', 'other')}  ")
+        w("---\n")
+        w("\n")
+        w(f"#### {i}. {f.get('headline', 'Update')}\n")
+        w("\n")
+        w(f"**Date:** {f.get('date', 'Unknown')}  \n")
+        w(f"**Confidence:** {confidence_emoji} {f.get('confidence', 'UNKNOWN')} "
+          f"({len(f.get('sources', []))} sources)  \n")
+        w(f"**Category:** {f.get('category', 'other')}  \n")
         states = f.get("affected_states", [])
         if states:
-            lines.append(f"**Affected states:** {', '.join(states)}  ")
-        lines.append(f"")
-        lines.append(f"{f.get('description', '')}")
-        lines.append(f"")
-        lines.append(f"**Sources:**")
+            w(f"**Affected states:** {', '.join(states)}  \n")
+        w("\n")
+        w(f"{f.get('description', '')}\n")
+        w("\n")
+        w("**Sources:**\n")
         for s in f.get("sources", []):
-            lines.append(f"- [{s.get('name', 'Source')}]({s.get('url', '#')})")
-        lines.append(f"")
-        lines.append(f"**Suggested timeline entry:** {f.get('suggested_timeline_entry', 'N/A')}")
-        lines.append(f"")
+            w(f"- [{s.get('name', 'Source')}]({s.get('url', '#')})\n")
+        w("\n")
+        w(f"**Suggested timeline entry:** {f.get('suggested_timeline_entry', 'N/A')}\n")
+        w("\n")
         if f.get("suggested_risk_changes", "none").lower() != "none":
-            lines.append(f"**Risk level changes:** {f['suggested_risk_changes']}")
-            lines.append(f"")
-
-    lines.append("---")
-    lines.append("")
-    lines.append("### What to do next")
-    lines.append("")
-    lines.append("If these updates are accurate and should be added to the site:")
-    lines.append("1. Comment `approved` on this issue")
-    lines.append("2. Open a conversation with Claude and say: "
-                 '"Update electionriskmap.org with the findings from Issue #[this number]"')
-    lines.append("3. Claude will update the site, RSS feed, and draft an email blast")
-    lines.append("")
-    lines.append("If any finding looks wrong, comment with corrections before approving.")
-    lines.append("")
-    lines.append("---")
-    lines.append("*Automated scan by electionriskmap.org monitoring pipeline. "
-                 "All findings require human approval before going live.*")
+            w(f"**Risk level changes:** {f['suggested_risk_changes']}\n")
+            w("\n")
 
-    return "\n".join(lines)
+    w(_NEXT_STEPS_FOOTER)
+    return buf.getvalue()
 
 
 def create_github_issue(title: str, body: str, labels: list = None) -> dict:
     """Create a GitHub Issue via the API."""
     if not GITHUB_TOKEN or not GITHUB_REPO:
-        print("Missing GITHUB_TOKEN or GITHUB_REPOSITORY — printing issue locally instead.")
-        print(f"\n{'='*60}")
-        print(f"ISSUE: {title}")
-        print(f"{'='*60}")
-        print(body)
+        rule = "=" * 60
+        sys.stdout.write(
+            "Missing GITHUB_TOKEN or GITHUB_REPOSITORY — printing issue locally instead.\n"
+            f"\n{rule}\nISSUE: {title}\n{rule}\n{body}\n"
+        )
+        sys.stdout.flush()
         return {}
 
     payload = {
@@ -277,27 +422,23 @@ def create_github_issue(title: str, body: str, labels: list = None) -> dict:
         "labels": labels or ["automated-scan"],
     }
 
-    data = json.dumps(payload).encode("utf-8")
-    req = urllib.request.Request(
-        f"https://api.github.com/repos/{GITHUB_REPO}/issues",
-        data=data,
-        headers={
+    data = json.dumps(payload, separators=JSON_SEPARATORS).encode("ascii")
+    status, resp_body = https_request(
+        "api.github.com",
+        "POST",
+        f"/repos/{GITHUB_REPO}/issues",
+        data,
+        {
             "Accept": "application/vnd.github+json",
             "Authorization": f"Bearer {GITHUB_TOKEN}",
             "Content-Type": "application/json",
+            # http.client sends no User-Agent and GitHub rejects requests without one
+            "User-Agent": "election-map-bot",
         },
-        method="POST",
     )
-
-    try:
-        with urllib.request.urlopen(req, timeout=30) as resp:
-            result = json.loads(resp.read().decode("utf-8"))
-            print(f"Created issue #{result.get('number')}: {result.get('html_url')}")
-            return result
-    except urllib.error.HTTPError as e:
-        body_text = e.read().decode("utf-8") if e.fp else ""
-        print(f"GitHub API error {e.code}: {body_text}", file=sys.stderr)
-        sys.exit(1)
+    result = json_or_exit("GitHub", status, resp_body)
+    print(f"Created issue #{result.get('number')}: {result.get('html_url')}")
+    return result
 
 
 def main():
@@ -305,24 +446,34 @@ def main():
         print("Error: ANTHROPIC_API_KEY not set.", file=sys.stderr)
         sys.exit(1)
 
+    from concurrent.futures import ThreadPoolExecutor
+
     print("🔍 Searching for election interference updates...")
-    response = call_claude(SEARCH_PROMPT)
-    text = extract_text(response)
+    prompt = build_prompt(get_current_timeline())
+    # Claude's web search takes a while; have the GitHub handshake done by the time it returns
+    with ThreadPoolExecutor(max_workers=1) as ex:
+        if GITHUB_TOKEN and GITHUB_REPO:
+            ex.submit(warm_connection, "api.github.com")
+        response = call_claude(prompt)
 
     print("📋 Parsing findings...")
-    findings = parse_findings(text)
+    findings = parse_findings_from_blocks(response.get("content", []))
+    if findings is None:
+        findings = parse_findings(extract_text(response))
 
     num_findings = len(findings.get("findings", []))
     no_updates = findings.get("no_updates", False)
 
     if no_updates or num_findings == 0:
         print("✅ No new verified developments found.")
-        # Still create an issue on Mondays for visibility (optional)
-        today = datetime.now(timezone.utc).strftime("%A")
-        if today == "Monday":
-            title = f"Weekly scan: No updates found — {datetime.now(timezone.utc).strftime('%b %d, %Y')}"
-            body = format_issue_body(findings)
-            create_github_issue(title, body, labels=["automated-scan", "no-updates"])
+        # Still create an issue on Mondays for visibility (optional);
+        # any other day there's nothing to format or send
+        now = datetime.now(timezone.utc)
+        if now.strftime("%A") != "Monday":
+            return
+        title = f"Weekly scan: No updates found — {now.strftime('%b %d, %Y')}"
+        body = format_issue_body(findings)
+        create_github_issue(title, body, labels=["automated-scan", "no-updates"])
         return
 
     print(f"🔔 Found {num_findings} update(s)!")